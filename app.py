@@ -1,13 +1,19 @@
 import os
 import streamlit as st
 import pandas as pd
-from src.io_handler import load_employees, load_holidays
+from src.io_handler import load_employees_cached, load_holidays_cached, load_workbook
 from datetime import timedelta, date
 from src.solver import RosterSolver
-from src.models import Shift
-from typing import List
+from src.models import Employee, Shift, PH_IMMUNITY_YEARS
+from typing import Dict, List
+from rustpy_xlsxwriter import FastExcel
 import io
 
+# --- PATH CONSTANTS ---
+BASE_DIR       = os.path.dirname(os.path.abspath(__file__))
+DATA_FOLDER    = os.path.join(BASE_DIR, "data")
+TEMP_FILE_PATH = os.path.join(DATA_FOLDER, "temp_data.xlsx")
+
 # --- PAGE CONFIG ---
 st.set_page_config(page_title="Duty Roster Planner", layout="wide", page_icon="🗓️")
 
@@ -29,11 +35,8 @@ if 'employees' not in st.session_state:
     st.session_state.employees = None
 if 'holidays' not in st.session_state:
     st.session_state.holidays = None
-
-# --- PATH CONSTANTS ---
-BASE_DIR       = os.path.dirname(os.path.abspath(__file__))
-DATA_FOLDER    = os.path.join(BASE_DIR, "data")
-TEMP_FILE_PATH = os.path.join(DATA_FOLDER, "temp_data.xlsx")
+if 'workbook_bytes' not in st.session_state:
+    st.session_state.workbook_bytes = None
 
 # --- UTILS ---
 # Within a single day AM slots sort before PM slots; everything else is 0
@@ -42,11 +45,108 @@ _SHIFT_SLOT_ORDER = {
     "Type O Weekend AM": 0, "Type O Weekend PM": 1,
 }
 
+# Shift labels that count as working a public holiday
+_PH_SHIFT_VALUES = {Shift.ORG_PH.value, Shift.TYPE_C_PH.value, Shift.TYPE_O_PH.value}
+
 def _sort_roster(df: pd.DataFrame) -> pd.DataFrame:
     """Sort by Date then by AM-before-PM within each day."""
     return df.assign(_ord=df["Shift"].map(_SHIFT_SLOT_ORDER).fillna(0)) \
              .sort_values(["Date", "_ord"]) \
-             .drop(columns=["_ord"])
+             .drop(columns=["_ord"]) \
+             .reset_index(drop=True)
+
+# Roster dates are datetime64; show and export them without a time part
+_ROSTER_COLUMNS    = {"Date": st.column_config.DateColumn(format="YYYY-MM-DD")}
+_EXCEL_DATE_FORMAT = "yyyy-mm-dd"
+
+def _for_export(df: pd.DataFrame) -> pd.DataFrame:
+    """FastExcel writes categorical columns as blanks, so hand it plain objects."""
+    cat_cols = df.select_dtypes("category").columns
+    return df.astype({c: object for c in cat_cols}) if len(cat_cols) else df
+
+@st.cache_data(hash_funcs={list: lambda es: tuple((e.name, e.team, e.role, e.ytd_points, e.last_ph_date) for e in es)})
+def build_personnel_df(employees: List[Employee], today: date) -> pd.DataFrame:
+    """Personnel overview table; cached so reruns with unchanged employees skip the rebuild."""
+    # Vectorised immunity: NaT (never worked a PH) compares False → Available
+    last_ph = pd.to_datetime(pd.Series([e.last_ph_date for e in employees], dtype="object"))
+    immune  = (last_ph + pd.DateOffset(years=PH_IMMUNITY_YEARS)) > pd.Timestamp(today)
+    return pd.DataFrame({
+        "Name":       [e.name for e in employees],
+        "Team":       [e.team for e in employees],
+        "Role":       [e.role.value for e in employees],
+        "YTD Points": [e.ytd_points for e in employees],
+        "PH Status":  immune.map({True: "🛡️ Immune", False: "✅ Available"}),
+        "Last PH":    last_ph.dt.strftime('%Y-%m-%d').fillna("Never"),
+    })
+
+def _updated_employees_sheet(df_emp: pd.DataFrame, roster_df: pd.DataFrame, summary_df: pd.DataFrame) -> pd.DataFrame:
+    """Copy of the Employees sheet with YTD and Last PH Date rolled forward by this roster."""
+    df_emp = df_emp.copy()
+    point_map = dict(zip(summary_df["Employee"], summary_df["Total Points"]))
+    df_emp["YTD"] = df_emp["Name"].map(point_map).fillna(df_emp["YTD"])
+    ph_worked = roster_df[roster_df["Shift"].isin(_PH_SHIFT_VALUES)]
+    latest_ph = ph_worked.groupby("Employee", sort=False, observed=True)["Date"].max()
+    # Only rows that worked a PH are written; every other cell (text, multi-date
+    # strings, blanks) is left exactly as uploaded
+    worked = df_emp["Name"].isin(latest_ph.index)
+    if worked.any():
+        if "Last PH Date" in df_emp and not pd.api.types.is_datetime64_any_dtype(df_emp["Last PH Date"]):
+            df_emp["Last PH Date"] = df_emp["Last PH Date"].astype(object)
+        df_emp.loc[worked, "Last PH Date"] = df_emp.loc[worked, "Name"].map(latest_ph)
+    return df_emp
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def roster_to_xlsx_bytes(roster_df: pd.DataFrame, summary_df: pd.DataFrame, workbook_bytes: bytes) -> bytes:
+    """Multi-sheet roster download; cached so reruns don't re-serialise the workbook."""
+    buffer = io.BytesIO()
+    builder = FastExcel(buffer).format(datetime_format=_EXCEL_DATE_FORMAT)
+    # 1. Org Roster
+    builder.sheet("Org Roster", _for_export(_sort_roster(roster_df[roster_df["Category"] == "Org"])))
+    # 2. Type C Roster
+    builder.sheet("Type C Roster", _for_export(_sort_roster(roster_df[roster_df["Category"] == "Type C"])))
+    # 3. Type O Roster
+    builder.sheet("Type O Roster", _for_export(_sort_roster(roster_df[roster_df["Category"] == "Type O"])))
+    # 4. Stats
+    builder.sheet("Stats", _for_export(summary_df))
+    # 5. Reupload-ready sheets (updated Employees + original Holidays)
+    all_sheets = load_workbook(workbook_bytes)
+    builder.sheet("Employees", _updated_employees_sheet(all_sheets["Employees"], roster_df, summary_df))
+    if "Holidays" in all_sheets:
+        builder.sheet("Holidays", all_sheets["Holidays"])
+    builder.save()
+    return buffer.getvalue()
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def master_database_bytes(roster_df: pd.DataFrame, summary_df: pd.DataFrame, workbook_bytes: bytes) -> bytes:
+    """Every sheet of the uploaded workbook with Employees updated; cached so
+    repeated Confirm clicks for the same roster don't re-serialise."""
+    # Only Employees is modified; the other cached sheets are written as-is
+    all_sheets = dict(load_workbook(workbook_bytes))
+    all_sheets["Employees"] = _updated_employees_sheet(all_sheets["Employees"], roster_df, summary_df)
+
+    buffer = io.BytesIO()
+    builder = FastExcel(buffer).format(datetime_format=_EXCEL_DATE_FORMAT)
+    for sheet_name, df in all_sheets.items():
+        builder.sheet(sheet_name, df)
+    builder.save()
+    return buffer.getvalue()
+
+@st.cache_data(show_spinner=False)
+def build_team_stats(roster_df: pd.DataFrame, summary_df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """Per-team analytics tables (team → frame); cached so reruns skip the groupbys."""
+    # Shift counts by category
+    org_counts    = roster_df[roster_df["Category"] == "Org"].groupby("Employee", observed=True).size()
+    type_c_counts = roster_df[roster_df["Category"] == "Type C"].groupby("Employee", observed=True).size()
+    type_o_counts = roster_df[roster_df["Category"] == "Type O"].groupby("Employee", observed=True).size()
+
+    # Add the count columns once over everyone, then slice per team (slices are only read)
+    stats = summary_df.assign(**{
+        "Org Shifts":    summary_df["Employee"].map(org_counts).fillna(0).astype(int),
+        "Type C Shifts": summary_df["Employee"].map(type_c_counts).fillna(0).astype(int),
+        "Type O Shifts": summary_df["Employee"].map(type_o_counts).fillna(0).astype(int),
+    })[["Employee", "Starting Points", "Org Shifts", "Type C Shifts",
+        "Type O Shifts", "Points Earned", "Total Points"]]
+    return {team: stats[summary_df["Team"] == team] for team in sorted(summary_df["Team"].unique())}
 
 def get_date_list(start_date: date, end_date: date) -> List[date]:
     if start_date > end_date: return []
@@ -60,14 +160,18 @@ with st.sidebar:
 
     uploaded_file = st.file_uploader("Upload Employee Excel", type=["xlsx"])
 
-    if uploaded_file:
-        if not os.path.exists(DATA_FOLDER): os.makedirs(DATA_FOLDER)
-
-        with open(TEMP_FILE_PATH, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+    keep_copy = st.checkbox("Save a copy of the upload to data/", value=False)
 
-        st.session_state.employees = load_employees(TEMP_FILE_PATH)
-        st.session_state.holidays = load_holidays(TEMP_FILE_PATH)
+    if uploaded_file:
+        file_bytes = uploaded_file.getvalue()
+        if keep_copy:
+            os.makedirs(DATA_FOLDER, exist_ok=True)
+            with open(TEMP_FILE_PATH, "wb") as f:
+                f.write(file_bytes)
+
+        st.session_state.workbook_bytes = file_bytes
+        st.session_state.employees = load_employees_cached(file_bytes)
+        st.session_state.holidays = load_holidays_cached(file_bytes)
         st.success("File Loaded Successfully")
 
     st.divider()
@@ -168,14 +272,8 @@ if st.session_state.roster_df is None:
     if st.session_state.employees:
         st.divider()
         st.subheader("Personnel Status Overview")
-        display_data = []
-        for e in st.session_state.employees:
-            display_data.append({
-                "Name": e.name, "Team": e.team, "Role": e.role.value, "YTD Points": e.ytd_points,
-                "PH Status": "🛡️ Immune" if e.is_immune(date.today()) else "✅ Available",
-                "Last PH": e.last_ph_date.strftime('%Y-%m-%d') if e.last_ph_date else "Never"
-            })
-        st.dataframe(pd.DataFrame(display_data), use_container_width=True, hide_index=True)
+        st.dataframe(build_personnel_df(st.session_state.employees, date.today()),
+                     use_container_width=True, hide_index=True)
 
 else:
     # --- POST-SOLVE DASHBOARD ---
@@ -191,80 +289,43 @@ else:
         with sub_tabs[0]:
             st.dataframe(
                 _sort_roster(roster_df[roster_df["Category"] == "Org"]),
-                use_container_width=True, hide_index=True)
+                use_container_width=True, hide_index=True, column_config=_ROSTER_COLUMNS)
 
         with sub_tabs[1]:
             st.dataframe(
                 _sort_roster(roster_df[roster_df["Category"] == "Type C"]),
-                use_container_width=True, hide_index=True)
+                use_container_width=True, hide_index=True, column_config=_ROSTER_COLUMNS)
 
         with sub_tabs[2]:
             st.dataframe(
                 _sort_roster(roster_df[roster_df["Category"] == "Type O"]),
-                use_container_width=True, hide_index=True)
+                use_container_width=True, hide_index=True, column_config=_ROSTER_COLUMNS)
 
         # Download multi-sheet roster
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-            # 1. Org Roster
-            _sort_roster(roster_df[roster_df["Category"] == "Org"]).to_excel(
-                writer, index=False, sheet_name="Org Roster")
-            # 2. Type C Roster
-            _sort_roster(roster_df[roster_df["Category"] == "Type C"]).to_excel(
-                writer, index=False, sheet_name="Type C Roster")
-            # 3. Type O Roster
-            _sort_roster(roster_df[roster_df["Category"] == "Type O"]).to_excel(
-                writer, index=False, sheet_name="Type O Roster")
-            # 4. Stats
-            st.session_state.summary_df.to_excel(writer, index=False, sheet_name="Stats")
-            # 5. Reupload-ready sheets (updated Employees + original Holidays)
-            all_sheets = pd.read_excel(TEMP_FILE_PATH, sheet_name=None)
-            df_emp = all_sheets["Employees"]
-            point_map = dict(zip(st.session_state.summary_df["Employee"],
-                                 st.session_state.summary_df["Total Points"]))
-            df_emp["YTD"] = df_emp["Name"].map(point_map).fillna(df_emp["YTD"])
-            ph_worked = roster_df[roster_df["Shift"].str.contains("PH", na=False)]
-            for _, row in ph_worked.iterrows():
-                df_emp.loc[df_emp["Name"] == row["Employee"], "Last PH Date"] = row["Date"]
-            df_emp.to_excel(writer, index=False, sheet_name="Employees")
-            if "Holidays" in all_sheets:
-                all_sheets["Holidays"].to_excel(writer, index=False, sheet_name="Holidays")
-
-        st.download_button("📥 Download Roster (.xlsx)", buffer.getvalue(), f"Roster_{date.today()}.xlsx", "application/vnd.ms-excel")
+        roster_bytes = roster_to_xlsx_bytes(roster_df, st.session_state.summary_df,
+                                            st.session_state.workbook_bytes)
+        st.download_button("📥 Download Roster (.xlsx)", roster_bytes, f"Roster_{date.today()}.xlsx", "application/vnd.ms-excel")
 
     with tab2:
         st.subheader("Points Analytics")
         roster_df  = st.session_state.roster_df
         summary_df = st.session_state.summary_df
-        teams = sorted(summary_df["Team"].unique())
-
-        # Shift counts by category
-        org_counts    = roster_df[roster_df["Category"] == "Org"].groupby("Employee").size()
-        type_c_counts = roster_df[roster_df["Category"] == "Type C"].groupby("Employee").size()
-        type_o_counts = roster_df[roster_df["Category"] == "Type O"].groupby("Employee").size()
+        team_stats = build_team_stats(roster_df, summary_df)
 
         # Overall fairness delta
         overall_delta = summary_df["Total Points"].max() - summary_df["Total Points"].min()
 
-        sub_tabs = st.tabs([f"👥 {t}" for t in teams])
-
-        for i, team in enumerate(teams):
-            with sub_tabs[i]:
-                df = summary_df[summary_df["Team"] == team].copy()
-                df["Org Shifts"]    = df["Employee"].map(org_counts).fillna(0).astype(int)
-                df["Type C Shifts"] = df["Employee"].map(type_c_counts).fillna(0).astype(int)
-                df["Type O Shifts"] = df["Employee"].map(type_o_counts).fillna(0).astype(int)
+        sub_tabs = st.tabs([f"👥 {t}" for t in team_stats])
 
+        for tab, (team, df) in zip(sub_tabs, team_stats.items()):
+            with tab:
                 team_delta = df["Total Points"].max() - df["Total Points"].min()
 
                 c1, c2 = st.columns(2)
                 c1.metric("Overall Fairness Delta", f"{overall_delta:.1f} pts")
                 c2.metric("Team Fairness Delta",    f"{team_delta:.1f} pts")
 
-                st.dataframe(
-                    df[["Employee", "Starting Points", "Org Shifts", "Type C Shifts", "Type O Shifts", "Points Earned", "Total Points"]],
-                    use_container_width=True, hide_index=True
-                )
+                st.dataframe(df, use_container_width=True, hide_index=True)
 
     with tab3:
         st.subheader("💾 Save & Update Database")
@@ -272,24 +333,9 @@ else:
 
         if st.button("✅ Confirm Roster & Update History"):
             try:
-                all_sheets = pd.read_excel(TEMP_FILE_PATH, sheet_name=None)
-                df_emp = all_sheets["Employees"]
-
-                point_map = dict(zip(st.session_state.summary_df["Employee"],
-                                     st.session_state.summary_df["Total Points"]))
-                df_emp["YTD"] = df_emp["Name"].map(point_map).fillna(df_emp["YTD"])
-
-                current_roster = st.session_state.roster_df
-                ph_worked = current_roster[current_roster["Shift"].str.contains("PH", na=False)]
-                for _, row in ph_worked.iterrows():
-                    df_emp.loc[df_emp["Name"] == row["Employee"], "Last PH Date"] = row["Date"]
-
-                update_buffer = io.BytesIO()
-                with pd.ExcelWriter(update_buffer, engine="xlsxwriter") as writer:
-                    for sheet_name, df in all_sheets.items():
-                        df.to_excel(writer, sheet_name=sheet_name, index=False)
-
-                st.session_state.final_database = update_buffer.getvalue()
+                st.session_state.final_database = master_database_bytes(
+                    st.session_state.roster_df, st.session_state.summary_df,
+                    st.session_state.workbook_bytes)
                 st.success("Database history updated! Download the new version below.")
 
             except Exception as e:
@@ -1,37 +1,66 @@
 
+import io
 import pandas as pd
-from typing import List, Set
+import streamlit as st
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Set, Tuple
 from .models import Employee, EmployeeType
-from dateutil import parser
 from datetime import date
 
+# Sheet value → EmployeeType, so role lookup is a dict hit rather than an
+# Enum call wrapped in try/except
+_ROLE_MAP = {e.value: e for e in EmployeeType}
+
 def load_holidays(filepath: str) -> Set[date]:
     """Reads the Holidays sheet and returns a set of date objects."""
     try:
         # Specifying sheet_name='Holidays' is the key here
-        df = pd.read_excel(filepath, sheet_name='Holidays')
-        
+        df = pd.read_excel(filepath, sheet_name='Holidays', engine='calamine')
+    except Exception as e:
+        # If the sheet doesn't exist yet, we return an empty set 
+        # so the solver just treats every day as a normal day.
+        print(f"Note: No 'Holidays' sheet found or error reading it: {e}")
+        return set()
+    return holidays_from_sheet(df)
+
+def holidays_from_sheet(df: pd.DataFrame) -> Set[date]:
+    """Set of holiday dates from an already-loaded Holidays sheet."""
+    try:
         # We clean the dates to ensure they are Python date objects
         holiday_dates = pd.to_datetime(df['Date']).dt.date.tolist()
         
         return set(holiday_dates)
     except Exception as e:
-        # If the sheet doesn't exist yet, we return an empty set 
-        # so the solver just treats every day as a normal day.
-        print(f"Note: No 'Holidays' sheet found or error reading it: {e}")
+        print(f"Note: Error reading the 'Holidays' sheet: {e}")
         return set()
 
-def parse_dates(cell) -> Set[date]:
+def parse_dates(cell) -> FrozenSet[date]:
     # 1. Handle actual Nulls
     if pd.isna(cell):
-        return set()
+        return frozenset()
 
     # 2. Convert to string and clean it
     cell_str = str(cell).strip()
     if not cell_str or cell_str.lower() == "nan":
-        return set()
+        return frozenset()
+
+    # Identical strings (shared holiday blocks etc.) are only parsed once;
+    # the warnings are printed here so every upload reports its own bad cells
+    found_dates, invalid = _parse_dates_str(cell_str)
+    for item in invalid:
+        print(f"⚠️ Skipping invalid date: '{item}'")
+    return found_dates
+
+def _is_date_token(item: str) -> bool:
+    """A date needs at least one digit; this rejects the 'today' / 'now'
+    keywords pandas resolves to the current time."""
+    return any(c.isdigit() for c in item)
 
+@lru_cache(maxsize=4096)
+def _parse_dates_str(cell_str: str) -> Tuple[FrozenSet[date], Tuple[str, ...]]:
+    """(dates, invalid tokens) for one cleaned cell string."""
     found_dates = set()
+    invalid     = []
     
     # 3. Split by common separators (comma, semicolon, or even newline)
     # We replace everything with a comma first, then split
@@ -41,55 +70,83 @@ def parse_dates(cell) -> Set[date]:
         clean_item = item.strip()
         if not clean_item:
             continue
+
+        dt = pd.to_datetime(clean_item, errors='coerce') if _is_date_token(clean_item) else pd.NaT
+        if pd.isna(dt):
+            invalid.append(clean_item)
+            continue
+        found_dates.add(dt.date())
             
-        try:
-            # The 'fuzzy' logic handles weird spaces or formats automatically
-            dt = parser.parse(clean_item, fuzzy=False)
-            found_dates.add(dt.date())
-        except (ValueError, OverflowError):
-            print(f"⚠️ Skipping invalid date: '{clean_item}'")
-            
-    return found_dates
+    return frozenset(found_dates), tuple(invalid)
+
+def _column(df: pd.DataFrame, name: str, default=None) -> list:
+    """Column as a plain list, or `default` repeated if the sheet lacks it."""
+    return df[name].tolist() if name in df.columns else [default] * len(df)
 
 def load_employees(filepath: str) -> List[Employee]:
     # Load the excel
-    df = pd.read_excel(filepath, sheet_name='Employees')
+    df = pd.read_excel(filepath, sheet_name='Employees', engine='calamine')
+    return employees_from_sheet(df)
+
+def employees_from_sheet(df: pd.DataFrame) -> List[Employee]:
+    """Employee records from an already-loaded Employees sheet."""
     employees = []
 
-    for index, row in df.iterrows():
+    # Pull each column out once; indexing plain lists is far cheaper than
+    # boxing every row into a Series with iterrows()
+    names          = _column(df, "Name")
+    teams          = _column(df, "Team", "")
+    roles          = _column(df, "Role", "Standard")
+    blackouts_alt  = _column(df, "Blackouts(dates)")
+    blackouts_col  = _column(df, "Blackouts")
+    ytds           = _column(df, "YTD", 0)
+    ph_bids_col    = _column(df, "PH Bids")
+    last_ph_raw    = _column(df, "Last PH Date")
+
+    # "Last PH Date" is almost always a single ISO date, so parse the whole
+    # column in one go; only cells that fail (e.g. several dates) fall back
+    # to parse_dates inside the loop. Cells without a digit ('today', 'now')
+    # are masked out first so pandas can't resolve them to the current time.
+    last_ph_series = pd.Series(last_ph_raw, dtype="object")
+    last_ph_series = last_ph_series.where(last_ph_series.astype(str).str.contains(r"\d"))
+    last_ph_parsed = pd.to_datetime(last_ph_series, errors='coerce', format='ISO8601').tolist()
+
+    for index in range(len(df)):
         # How do we check if the name is empty?
         # How do we turn the string 'Standard' into EmployeeType.STANDARD?
-        name_raw = row.get("Name")
+        name_raw = names[index]
 
         if pd.isna(name_raw) or str(name_raw).strip() == "":
             print(f"Skipping row {index}: Name is missing.")
             continue
         name = str(name_raw).strip()
 
-        team = str(row.get("Team", "")).strip()
+        team = str(teams[index]).strip()
         if not team:
             print(f"Warning: No team for {name}. Skipping row {index}.")
             continue
 
-        role_str = str(row.get("Role", "Standard")).strip()
-        try:
-            role = EmployeeType(role_str)
-        except ValueError:
-            print(f"Warning: Invalid role '{role_str}' for {name}. Defaulting to Standard.")
+        role_str = str(roles[index]).strip()
+        role = _ROLE_MAP.get(role_str)
+        if role is None:
+            if role_str:
+                print(f"Warning: Invalid role '{role_str}' for {name}. Defaulting to Standard.")
             role = EmployeeType.STANDARD
 
-        blackout_data = row.get("Blackouts(dates)") or row.get("Blackouts") or ""
+        blackout_data = blackouts_alt[index] or blackouts_col[index] or ""
         blackouts = parse_dates(blackout_data)
 
-        ytd_raw = row.get("YTD", 0)
+        ytd_raw = ytds[index]
         ytd = int(ytd_raw) if not pd.isna(ytd_raw) else 0
 
-        ph_bids_raw = row.get("PH Bids")
-        ph_bids = parse_dates(ph_bids_raw)
+        ph_bids = parse_dates(ph_bids_col[index])
 
-        last_ph_raw = row.get("Last PH Date")
-        last_ph_set = parse_dates(last_ph_raw)
-        last_ph = max(last_ph_set) if last_ph_set else None
+        last_ph_ts = last_ph_parsed[index]
+        if pd.notna(last_ph_ts):
+            last_ph = last_ph_ts.date()
+        else:
+            last_ph_set = parse_dates(last_ph_raw[index])
+            last_ph = max(last_ph_set) if last_ph_set else None
 
         employees.append(Employee(
             name=name,
@@ -103,8 +160,31 @@ def load_employees(filepath: str) -> List[Employee]:
 
     return employees
 
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_workbook(file_bytes: bytes) -> Dict[str, pd.DataFrame]:
+    """Every sheet of the uploaded workbook, parsed once per distinct upload.
+
+    The dict is shared across reruns and sessions – copy a sheet before
+    mutating it.
+    """
+    return pd.read_excel(io.BytesIO(file_bytes), sheet_name=None, engine='calamine')
+
+@st.cache_data(show_spinner=False)
+def load_holidays_cached(file_bytes: bytes) -> Set[date]:
+    """load_holidays keyed on the uploaded workbook's bytes, so reruns skip the parse."""
+    sheets = load_workbook(file_bytes)
+    if 'Holidays' not in sheets:
+        print("Note: No 'Holidays' sheet found.")
+        return set()
+    return holidays_from_sheet(sheets['Holidays'])
+
+@st.cache_data(show_spinner=False)
+def load_employees_cached(file_bytes: bytes) -> List[Employee]:
+    """load_employees keyed on the uploaded workbook's bytes, so reruns skip the parse."""
+    return employees_from_sheet(load_workbook(file_bytes)['Employees'])
+
 def update_employee_points(filepath, summary_df):
-    original_df = pd.read_excel(filepath)
+    original_df = pd.read_excel(filepath, engine='calamine')
     point_map = dict(zip(summary_df['Employee'], summary_df['Total Points']))
     original_df['YTD'] = original_df['Name'].map(point_map).fillna(original_df['YTD'])
     original_df.to_excel(filepath, index=False, sheet_name='Employees')
\ No newline at end of file
@@ -1,8 +1,10 @@
 
 from enum import Enum
 from dataclasses import dataclass, field
-from typing import Set, Optional
+from typing import FrozenSet, Iterable, List, Optional
 from datetime import date
+from calendar import isleap
+import numpy as np
 
 # ---------------------------------------------------------------------------
 # Team → duty-category mapping  (notes.txt)
@@ -10,6 +12,9 @@ from datetime import date
 TYPE_C_TEAMS = {"Blue", "Yellow", "Orange", "Green", "Purple", "Violet"}
 TYPE_O_TEAMS = {"Black", "White", "Grey", "Red"}
 
+# Years after working a PH during which an employee is exempt from PH duty
+PH_IMMUNITY_YEARS = 2
+
 class EmployeeType(Enum):
     STANDARD = "Standard"
     WEEKEND_ONLY = "Weekend-Only"
@@ -32,55 +37,139 @@ class Shift(Enum):
 
     @property
     def is_org(self) -> bool:
-        return self in (Shift.ORG_WEEKDAY_PM, Shift.ORG_WEEKEND, Shift.ORG_PH)
+        return self in _ORG_SHIFTS
 
     @property
     def is_type_c(self) -> bool:
-        return self in (Shift.TYPE_C_WEEKDAY_PM, Shift.TYPE_C_WEEKEND_AM,
-                        Shift.TYPE_C_WEEKEND_PM, Shift.TYPE_C_PH)
+        return self in _TYPE_C_SHIFTS
 
     @property
     def is_type_o(self) -> bool:
-        return self in (Shift.TYPE_O_WEEKDAY_PM, Shift.TYPE_O_WEEKEND_AM,
-                        Shift.TYPE_O_WEEKEND_PM, Shift.TYPE_O_PH)
+        return self in _TYPE_O_SHIFTS
 
     @property
     def category(self) -> str:
-        if self.is_org:    return "Org"
-        if self.is_type_c: return "Type C"
-        return "Type O"
+        return _SHIFT_CATEGORY[self]
+
+# Category membership built once rather than as a tuple on every lookup
+_ORG_SHIFTS    = frozenset({Shift.ORG_WEEKDAY_PM, Shift.ORG_WEEKEND, Shift.ORG_PH})
+_TYPE_C_SHIFTS = frozenset({Shift.TYPE_C_WEEKDAY_PM, Shift.TYPE_C_WEEKEND_AM,
+                            Shift.TYPE_C_WEEKEND_PM, Shift.TYPE_C_PH})
+_TYPE_O_SHIFTS = frozenset({Shift.TYPE_O_WEEKDAY_PM, Shift.TYPE_O_WEEKEND_AM,
+                            Shift.TYPE_O_WEEKEND_PM, Shift.TYPE_O_PH})
+_SHIFT_CATEGORY = {s: "Org" if s in _ORG_SHIFTS else "Type C" if s in _TYPE_C_SHIFTS else "Type O"
+                   for s in Shift}
+
+# ---------------------------------------------------------------------------
+# Day-type eligibility as bitmasks – can_work tests one AND instead of
+# building a tuple of Shift members on every call
+# ---------------------------------------------------------------------------
+SHIFT_INDEX = {s: i for i, s in enumerate(Shift)}      # shift axis of build_feasibility
+_SHIFT_BIT  = {s: 1 << i for s, i in SHIFT_INDEX.items()}
+
+def _shift_mask(*shifts: Shift) -> int:
+    mask = 0
+    for s in shifts:
+        mask |= _SHIFT_BIT[s]
+    return mask
 
-@dataclass
+# Shift layout per day type, in running order (AM before PM) – the single
+# definition shared by can_work's masks and the solver's daily slots
+SHIFTS_PH      = (Shift.ORG_PH, Shift.TYPE_C_PH, Shift.TYPE_O_PH)
+SHIFTS_WEEKEND = (Shift.ORG_WEEKEND,
+                  Shift.TYPE_C_WEEKEND_AM, Shift.TYPE_C_WEEKEND_PM,
+                  Shift.TYPE_O_WEEKEND_AM, Shift.TYPE_O_WEEKEND_PM)
+SHIFTS_WEEKDAY = (Shift.ORG_WEEKDAY_PM, Shift.TYPE_C_WEEKDAY_PM, Shift.TYPE_O_WEEKDAY_PM)
+
+_PH_MASK      = _shift_mask(*SHIFTS_PH)
+_WEEKEND_MASK = _shift_mask(*SHIFTS_WEEKEND)
+_WEEKDAY_MASK = _shift_mask(*SHIFTS_WEEKDAY)
+
+def _immunity_end_date(last_ph_date: Optional[date], years_threshold: int) -> Optional[date]:
+    """First day an employee is no longer PH-immune (Feb 29 rolls back to Feb 28)."""
+    if not last_ph_date:
+        return None
+    year = last_ph_date.year + years_threshold
+    day  = last_ph_date.day
+    if last_ph_date.month == 2 and day == 29 and not isleap(year):
+        day = 28
+    return last_ph_date.replace(year=year, day=day)
+
+@dataclass(slots=True)                # no per-instance __dict__; faster attribute reads in the solver
 class Employee:
     name: str
     team: str
     role: EmployeeType
     ytd_points: int = 0
-    blackouts: Set[date] = field(default_factory=set)
-    ph_bids: Set[date] = field(default_factory=set)
+    blackouts: FrozenSet[date] = frozenset()
+    ph_bids: FrozenSet[date] = frozenset()
     last_ph_date: Optional[date] = None
+    # Derived once in __post_init__: the ordinal feeds build_feasibility,
+    # the date feeds is_immune
+    _immunity_end: Optional[date] = field(default=None, init=False, repr=False, compare=False)
+    _immunity_end_ord: int = field(default=0, init=False, repr=False, compare=False)   # 0 = never immune
 
-    def is_immune(self, day: date, years_threshold: int = 2) -> bool:
-        if not self.last_ph_date:
-            return False
-        try:
-            immunity_end_date = self.last_ph_date.replace(year=self.last_ph_date.year + years_threshold)
-        except ValueError:
-            immunity_end_date = self.last_ph_date.replace(year=self.last_ph_date.year + years_threshold, day=28)
-        return day < immunity_end_date
+    def __post_init__(self):
+        self.blackouts     = frozenset(self.blackouts)
+        self.ph_bids       = frozenset(self.ph_bids)
+        self._immunity_end = _immunity_end_date(self.last_ph_date, PH_IMMUNITY_YEARS)
+        if self._immunity_end:
+            self._immunity_end_ord = self._immunity_end.toordinal()
+
+    def is_immune(self, day: date, years_threshold: int = PH_IMMUNITY_YEARS) -> bool:
+        if years_threshold == PH_IMMUNITY_YEARS:
+            immunity_end_date = self._immunity_end
+        else:
+            immunity_end_date = _immunity_end_date(self.last_ph_date, years_threshold)
+        return immunity_end_date is not None and day < immunity_end_date
 
     def can_work(self, day: date, shift: Shift, is_public_holiday: bool = False) -> bool:
+        """Scalar reference for one build_feasibility entry. The solver only
+        reads the tensor; this spells out the rule the tensor must match."""
         if day in self.blackouts:
             return False
-        if is_public_holiday and self.is_immune(day):
-            return False
 
+        bit = _SHIFT_BIT[shift]
         if is_public_holiday:
-            return shift in (Shift.ORG_PH, Shift.TYPE_C_PH, Shift.TYPE_O_PH)
+            return bool(bit & _PH_MASK) and not self.is_immune(day)
 
         if day.weekday() >= 5:  # weekend
-            return shift in (Shift.ORG_WEEKEND,
-                             Shift.TYPE_C_WEEKEND_AM, Shift.TYPE_C_WEEKEND_PM,
-                             Shift.TYPE_O_WEEKEND_AM, Shift.TYPE_O_WEEKEND_PM)
+            return bool(bit & _WEEKEND_MASK)
+
+        return bool(bit & _WEEKDAY_MASK)
+
+# ---------------------------------------------------------------------------
+# Columnar feasibility – the whole can_work grid in one pass
+# ---------------------------------------------------------------------------
+def build_feasibility(employees: List[Employee], dates: List[date], public_holidays: Iterable[date]) -> np.ndarray:
+    """Boolean (employee, day, shift) tensor; entry [e, d, SHIFT_INDEX[s]] equals
+    employees[e].can_work(dates[d], s, dates[d] in public_holidays)."""
+    public_holidays = set(public_holidays)
+    n_emp, n_days = len(employees), len(dates)
+
+    is_ph      = np.fromiter((d in public_holidays for d in dates), bool, n_days)
+    is_weekend = np.fromiter((d.weekday() >= 5 for d in dates), bool, n_days)
+    day_ords   = np.fromiter((d.toordinal() for d in dates), np.int64, n_days)
+
+    def shift_row(mask: int) -> np.ndarray:
+        return np.array([bool(_SHIFT_BIT[s] & mask) for s in Shift])
+
+    # (D, S): which shifts exist on each day type
+    day_ok = np.where(is_ph[:, None], shift_row(_PH_MASK)[None, :],
+                      np.where(is_weekend[:, None], shift_row(_WEEKEND_MASK)[None, :],
+                               shift_row(_WEEKDAY_MASK)[None, :]))
+
+    # (E, D) personal blackouts – scatter each employee's in-range dates
+    # rather than testing every (employee, day) pair
+    day_index = {d: i for i, d in enumerate(dates)}
+    blackout  = np.zeros((n_emp, n_days), dtype=bool)
+    for e, emp in enumerate(employees):
+        hits = [day_index[d] for d in emp.blackouts if d in day_index]
+        if hits:
+            blackout[e, hits] = True
+
+    # (E, D) PH immunity, which only matters on a PH
+    immunity_end = np.fromiter((emp._immunity_end_ord for emp in employees), np.int64, n_emp)
+    immune_on_ph = (day_ords[None, :] < immunity_end[:, None]) & is_ph[None, :]
 
-        return shift in (Shift.ORG_WEEKDAY_PM, Shift.TYPE_C_WEEKDAY_PM, Shift.TYPE_O_WEEKDAY_PM)
+    return day_ok[None, :, :] & ~(blackout | immune_on_ph)[:, :, None]
@@ -1,7 +1,12 @@
+import os
 from ortools.sat.python import cp_model
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Tuple
+from collections import defaultdict
+from functools import lru_cache
 from datetime import date
-from .models import Employee, Shift, EmployeeType, TYPE_C_TEAMS, TYPE_O_TEAMS
+from .models import (Employee, Shift, EmployeeType, TYPE_C_TEAMS, TYPE_O_TEAMS, SHIFT_INDEX, build_feasibility,
+                     SHIFTS_PH, SHIFTS_WEEKEND, SHIFTS_WEEKDAY)
+import numpy as np
 import pandas as pd
 import random
 
@@ -19,15 +24,35 @@ DEFAULT_POINT_VALUES = {
     Shift.TYPE_O_PH:           2.0,
 }
 
+_ROSTER_COLUMNS = ("Date", "Day", "Employee", "Team", "Category", "Shift")
+
+@lru_cache(maxsize=None)
+def _day_name(d: date) -> str:
+    return d.strftime('%A')
+
+def _usable_cpus() -> int:
+    # The affinity mask honours taskset pinning and cgroup cpusets, which
+    # os.cpu_count() ignores; it is not available on macOS or Windows
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 8
+
 class RosterSolver:
+    TIME_LIMIT = 10.0                                     # seconds, shared by both solve passes
+
     def __init__(self, employees: List[Employee], date_range: List[date], public_holidays: Set[date],
-                 point_values: Dict[Shift, float] = None, role_max_shifts: Dict[str, int] = None):
+                 point_values: Dict[Shift, float] = None, role_max_shifts: Dict[str, int] = None,
+                 balance_deviation: bool = False, debug: bool = False):
         self.employees       = employees
         self.date_range      = date_range
-        self.public_holidays = public_holidays
+        self.public_holidays = frozenset(public_holidays)
         self.model           = cp_model.CpModel()
         self.variables       = {}
+        self.vars_by_emp: Dict[str, List[Tuple[date, Shift, cp_model.IntVar]]] = defaultdict(list)
+        self.worked: Dict[Tuple[str, int], cp_model.IntVar] = {}
         self.errors          = []
+        self.balance_deviation = balance_deviation        # opt-in tie-break pass, see solve()
+        self.debug           = debug                      # name CP-SAT vars for model dumps
 
         # Convert display point values (float) → internal integer weights (×10)
         pv = point_values if point_values else DEFAULT_POINT_VALUES
@@ -42,6 +67,13 @@ class RosterSolver:
         self.team_sizes     = {t: len(emps) for t, emps in self.team_employees.items()}
         self.emp_team       = {emp.name: emp.team for emp in employees}
 
+        # Per-day lookups, indexed by position in date_range, so the
+        # constraint builders don't recompute the day layout each pass
+        n_days              = len(date_range)
+        self._weekday       = np.fromiter((d.weekday() for d in date_range), np.int8, n_days)
+        self._is_ph         = np.fromiter((d in self.public_holidays for d in date_range), np.bool_, n_days)
+        self._shifts_by_day = [self._get_shifts_for_day(i) for i in range(n_days)]
+
         # Pre-select duty teams per shift type (before CP-SAT)
         self._build_shift_team_map()
 
@@ -64,8 +96,8 @@ class RosterSolver:
         self.shift_team_map  = {}                         # (Shift, date) → team
         prev_per_category    = {}                         # category → last team chosen
 
-        for d in self.date_range:
-            for s in self._get_shifts_for_day(d):         # AM returned before PM
+        for i, d in enumerate(self.date_range):
+            for s in self._shifts_by_day[i]:              # AM returned before PM
                 eligible = pool_for[s]
                 teams    = [t for t in self.team_sizes if t in eligible]
                 sizes    = {t: self.team_sizes[t] for t in teams}
@@ -82,14 +114,13 @@ class RosterSolver:
     # ------------------------------------------------------------------
     # Shift layout per day type
     # ------------------------------------------------------------------
-    def _get_shifts_for_day(self, d: date) -> List[Shift]:
-        if d in self.public_holidays:
-            return [Shift.ORG_PH, Shift.TYPE_C_PH, Shift.TYPE_O_PH]
-        if d.weekday() >= 5:                         # Saturday / Sunday
-            return [Shift.ORG_WEEKEND,
-                    Shift.TYPE_C_WEEKEND_AM, Shift.TYPE_C_WEEKEND_PM,
-                    Shift.TYPE_O_WEEKEND_AM, Shift.TYPE_O_WEEKEND_PM]
-        return [Shift.ORG_WEEKDAY_PM, Shift.TYPE_C_WEEKDAY_PM, Shift.TYPE_O_WEEKDAY_PM]
+    def _get_shifts_for_day(self, i: int) -> Tuple[Shift, ...]:
+        """Shifts on date_range[i]."""
+        if self._is_ph[i]:
+            return SHIFTS_PH
+        if self._weekday[i] >= 5:                    # Saturday / Sunday
+            return SHIFTS_WEEKEND
+        return SHIFTS_WEEKDAY
 
     # ------------------------------------------------------------------
     # Variables
@@ -102,73 +133,85 @@ class RosterSolver:
 
     def _create_variables(self):
         """Boolean var for every valid (employee, date, shift) triple."""
-        for d in self.date_range:
-            is_ph = d in self.public_holidays
-            for s in self._get_shifts_for_day(d):
-                for emp in self._candidates_for(d, s):
-                    if emp.can_work(d, s, is_public_holiday=is_ph):
-                        self.variables[(emp.name, d, s)] = self.model.NewBoolVar(f"{emp.name}_{d}_{s.name}")
+        feasible  = build_feasibility(self.employees, self.date_range, self.public_holidays)
+        emp_index = {emp.name: i for i, emp in enumerate(self.employees)}
+        team_rows = {t: np.array([emp_index[e.name] for e in emps], dtype=np.intp)
+                     for t, emps in self.team_employees.items()}
+        for i, d in enumerate(self.date_range):
+            for s in self._shifts_by_day[i]:
+                team = self.shift_team_map.get((s, d))
+                if team is None:
+                    continue
+                # Only visit the duty team's members who pass can_work
+                rows = team_rows[team]
+                for e in rows[feasible[rows, i, SHIFT_INDEX[s]]]:
+                    emp = self.employees[e]
+                    var = self.model.NewBoolVar(f"{emp.name}_{d}_{s.name}" if self.debug else "")
+                    self.variables[(emp.name, d, s)] = var
+                    self.vars_by_emp[emp.name].append((d, s, var))
+
+        # worked[(emp, i)] ⇔ emp takes a shift on date_range[i]; the
+        # equality also caps each employee at one shift per day.  Only days
+        # where an employee is a candidate for several shifts need any cap,
+        # and only those next to another candidate day need the literal.
+        day_index = {d: i for i, d in enumerate(self.date_range)}
+        for emp_name, slots in self.vars_by_emp.items():
+            by_day = defaultdict(list)
+            for d, _, var in slots:
+                by_day[day_index[d]].append(var)
+            for i, day_vars in by_day.items():
+                if len(day_vars) == 1:
+                    self.worked[(emp_name, i)] = day_vars[0]
+                elif i - 1 not in by_day and i + 1 not in by_day:
+                    self.model.AddAtMostOne(day_vars)
+                else:
+                    worked = self.model.NewBoolVar(f"{emp_name}_{self.date_range[i]}_worked" if self.debug else "")
+                    # sum(day_vars) == worked, as a native exactly-one
+                    self.model.AddExactlyOne(day_vars + [worked.Not()])
+                    self.worked[(emp_name, i)] = worked
 
     # ------------------------------------------------------------------
     # Coverage – every slot must be filled (exactly 1 person per shift per day)
     # ------------------------------------------------------------------
     def _add_coverage_constraints(self):
-        for d in self.date_range:
-            for s in self._get_shifts_for_day(d):
+        for i, d in enumerate(self.date_range):
+            for s in self._shifts_by_day[i]:
                 relevant = [
                     self.variables[(emp.name, d, s)]
                     for emp in self._candidates_for(d, s)
                     if (emp.name, d, s) in self.variables
                 ]
                 if relevant:
-                    self.model.Add(sum(relevant) == 1)
+                    self.model.AddExactlyOne(relevant)
                 else:
                     self.errors.append(
                         f"❌ Cannot fill: {d.strftime('%Y-%m-%d')} — {s.value}. No eligible employees."
                     )
 
     # ------------------------------------------------------------------
-    # At most one shift per employee per day
+    # Total workload – implied by coverage, stated once so the LP sees the
+    # fixed number of shifts to hand out in a single row
     # ------------------------------------------------------------------
-    def _add_one_shift_per_day(self):
-        for emp in self.employees:
-            for d in self.date_range:
-                day_vars = [
-                    self.variables[(emp.name, d, s)]
-                    for s in self._get_shifts_for_day(d)
-                    if (emp.name, d, s) in self.variables
-                ]
-                if len(day_vars) > 1:
-                    self.model.Add(sum(day_vars) <= 1)
+    def _add_total_workload_constraint(self):
+        total_shifts = sum(len(shifts) for shifts in self._shifts_by_day)
+        self.model.Add(sum(self.variables.values()) == total_shifts)
 
     # ------------------------------------------------------------------
-    # Mandatory 1-day rest
+    # Mandatory 1-day rest – no shifts on consecutive days
     # ------------------------------------------------------------------
     def _add_rest_constraints(self):
-        for emp in self.employees:
-            for i in range(len(self.date_range) - 1):
-                today    = self.date_range[i]
-                tomorrow = self.date_range[i + 1]
-
-                today_vars = [
-                    self.variables[(emp.name, today, s)]
-                    for s in self._get_shifts_for_day(today)
-                    if (emp.name, today, s) in self.variables
-                ]
-                tomorrow_vars = [
-                    self.variables[(emp.name, tomorrow, s)]
-                    for s in self._get_shifts_for_day(tomorrow)
-                    if (emp.name, tomorrow, s) in self.variables
-                ]
-                if today_vars and tomorrow_vars:
-                    self.model.Add(sum(today_vars) + sum(tomorrow_vars) <= 1)
+        # Walk only the (employee, day) pairs that have a worked literal
+        for (emp_name, i), today in self.worked.items():
+            tomorrow = self.worked.get((emp_name, i + 1))
+            if tomorrow is not None:
+                self.model.AddBoolOr([today.Not(), tomorrow.Not()])
 
     # ------------------------------------------------------------------
     # PH bidding – bidders get priority on Org PH slots
     # ------------------------------------------------------------------
     def _add_ph_bidding_constraints(self):
-        for d in self.date_range:
-            if d not in self.public_holidays:
+        for i, d in enumerate(self.date_range):
+            if not self._is_ph[i]:
                 continue
             s = Shift.ORG_PH
             bidders = [emp for emp in self.employees if d in emp.ph_bids]
@@ -178,7 +221,45 @@ class RosterSolver:
                 if (emp.name, d, s) in self.variables
             ]
             if bidder_vars:
-                self.model.Add(sum(bidder_vars) == 1)
+                self.model.AddExactlyOne(bidder_vars)
+
+    # ------------------------------------------------------------------
+    # Symmetry breaking – employees who are identical in every input the
+    # model sees (team, role, points, blackouts, bids, last PH) can swap
+    # rosters freely, so order each such group lexicographically.
+    # ------------------------------------------------------------------
+    def _add_symmetry_breaking_constraints(self):
+        groups = defaultdict(list)
+        for emp in self.employees:
+            key = (emp.team, emp.role, emp.ytd_points, emp.blackouts, emp.ph_bids, emp.last_ph_date)
+            groups[key].append(emp)
+
+        for group in groups.values():
+            if len(group) < 2:
+                continue
+            group = sorted(group, key=lambda e: e.name)
+            for a, b in zip(group, group[1:]):
+                slots_a = self.vars_by_emp[a.name]
+                slots_b = self.vars_by_emp[b.name]
+                if [(d, s) for d, s, _ in slots_a] != [(d, s) for d, s, _ in slots_b]:
+                    continue
+                self._add_lex_greater_equal([v for _, _, v in slots_a], [v for _, _, v in slots_b])
+
+    def _add_lex_greater_equal(self, xs: List[cp_model.IntVar], ys: List[cp_model.IntVar]):
+        """Constrain Bool vector xs to be lexicographically >= ys."""
+        prefix_equal = None                               # None: empty prefix, always equal
+        for k, (x, y) in enumerate(zip(xs, ys)):
+            ct = self.model.Add(x >= y)
+            if prefix_equal is not None:
+                ct.OnlyEnforceIf(prefix_equal)
+            if k == len(xs) - 1:
+                break
+            # Prefix stays equal unless x=1, y=0 here: prefix ∧ (¬x ∨ y) → equal
+            equal = self.model.NewBoolVar("")
+            guard = [prefix_equal.Not()] if prefix_equal is not None else []
+            self.model.AddBoolOr(guard + [x, equal])
+            self.model.AddBoolOr(guard + [y.Not(), equal])
+            prefix_equal = equal
 
     # ------------------------------------------------------------------
     # Per-role maximum shift cap
@@ -188,34 +269,125 @@ class RosterSolver:
             max_s = self.role_max_shifts.get(emp.role.value)
             if max_s is None:
                 continue
-            emp_vars = [
-                self.variables[(emp.name, d, s)]
-                for d in self.date_range
-                for s in self._get_shifts_for_day(d)
-                if (emp.name, d, s) in self.variables
-            ]
+            emp_vars = [var for _, _, var in self.vars_by_emp[emp.name]]
             if emp_vars:
                 self.model.Add(sum(emp_vars) <= max_s)
 
     # ------------------------------------------------------------------
-    # Objective: minimise point spread across all employees
+    # Objective: minimise the max–min points spread.  Each employee's
+    # distance from the mean total is modelled too, so that with
+    # balance_deviation set a second pass can minimise it as a
+    # tie-breaker (see solve()).
     # ------------------------------------------------------------------
     def _set_fairness_objective(self):
         employee_totals = []
+        bounds          = []                              # (lowest, highest) reachable total
         for emp in self.employees:
-            total = emp.ytd_points * 10
-            for (name, d, s), var in self.variables.items():
-                if name == emp.name:
-                    total += var * self.point_weights.get(s, 10)
+            total   = emp.ytd_points * 10
+            weights = []
+            for _, s, var in self.vars_by_emp[emp.name]:
+                w = self.point_weights.get(s, 10)
+                total += var * w
+                weights.append(w)
+            max_s = self.role_max_shifts.get(emp.role.value)
+            if max_s is not None:
+                weights = sorted(weights, reverse=True)[:max_s]
             employee_totals.append(total)
-
-        max_pts = self.model.NewIntVar(0, 100000, "max_pts")
-        min_pts = self.model.NewIntVar(0, 100000, "min_pts")
+            bounds.append((emp.ytd_points * 10, emp.ytd_points * 10 + sum(weights)))
+
+        # Every slot is filled exactly once, so the points handed out are fixed
+        # and the ideal per-employee total is known before solving
+        shift_points = sum(self.point_weights.get(s, 10) for shifts in self._shifts_by_day for s in shifts)
+        ytd_points   = sum(emp.ytd_points * 10 for emp in self.employees)
+        target       = round((ytd_points + shift_points) / max(len(self.employees), 1))
+
+        # Domains are cut to the reachable range so presolve starts tight
+        deviations = []
+        for i, (total, (lo, hi)) in enumerate(zip(employee_totals, bounds)):
+            dev = self.model.NewIntVar(0, max(hi - target, target - lo, 0), f"dev_{i}")
+            self.model.Add(dev >= total - target)
+            self.model.Add(dev >= target - total)
+            deviations.append(dev)
+
+        lows, highs = zip(*bounds) if bounds else ((0,), (0,))
+        max_pts = self.model.NewIntVar(max(lows), max(highs), "max_pts")
+        min_pts = self.model.NewIntVar(min(lows), min(highs), "min_pts")
         for total in employee_totals:
             self.model.Add(max_pts >= total)
             self.model.Add(min_pts <= total)
 
-        self.model.Minimize(max_pts - min_pts)
+        self.spread        = max_pts - min_pts
+        self.deviation_sum = sum(deviations)
+        self.model.Minimize(self.spread)
+
+    # ------------------------------------------------------------------
+    # Warm start – greedy roster handed to CP-SAT as a solution hint.
+    # Each slot goes to the eligible candidate with the lowest running
+    # total who is free today and rested, bidders first on Org PH.
+    # ------------------------------------------------------------------
+    def _add_greedy_hint(self):
+        running   = {emp.name: emp.ytd_points * 10 for emp in self.employees}
+        shifts    = {emp.name: 0 for emp in self.employees}
+        max_for   = {emp.name: self.role_max_shifts.get(emp.role.value) for emp in self.employees}
+        last_day  = {}                                    # emp → index of last day worked
+
+        for i, d in enumerate(self.date_range):
+            for s in self._shifts_by_day[i]:
+                slot = [(emp, self.variables[(emp.name, d, s)])
+                        for emp in self._candidates_for(d, s)
+                        if (emp.name, d, s) in self.variables]
+                free = [(emp, var) for emp, var in slot
+                        if last_day.get(emp.name, -2) < i - 1
+                        and (max_for[emp.name] is None or shifts[emp.name] < max_for[emp.name])]
+                if s is Shift.ORG_PH:
+                    free = [(emp, var) for emp, var in free if d in emp.ph_bids] or free
+
+                chosen = min(free, key=lambda ev: running[ev[0].name])[0] if free else None
+                for emp, var in slot:
+                    self.model.AddHint(var, emp is chosen)
+                if chosen is not None:
+                    running[chosen.name] += self.point_weights.get(s, 10)
+                    shifts[chosen.name]  += 1
+                    last_day[chosen.name] = i
+
+    # ------------------------------------------------------------------
+    # CP-SAT parameters shared by both solve passes
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _new_solver(time_limit: float) -> cp_model.CpSolver:
+        solver = cp_model.CpSolver()
+        solver.parameters.max_time_in_seconds = time_limit
+        # The default (0) already uses every core; cap it at the 16 workers
+        # the portfolio is tuned for
+        solver.parameters.num_workers = min(16, _usable_cpus())
+        # Full linearisation lets the LP close the bound on the objective
+        solver.parameters.linearization_level = 2
+        # Both restate CP-SAT's defaults.  The seed does not make runs
+        # repeatable: multi-worker search under a wall-clock limit is
+        # nondeterministic, and the duty-team draw is unseeded
+        solver.parameters.symmetry_level = 2
+        solver.parameters.random_seed    = 1
+        return solver
+
+    # ------------------------------------------------------------------
+    # Tie-break (opt-in) – hold the proven spread and spend whatever is
+    # left of the time budget pulling everyone towards the mean total
+    # ------------------------------------------------------------------
+    def _tie_break_on_deviation(self, solver: cp_model.CpSolver) -> cp_model.CpSolver:
+        remaining = self.TIME_LIMIT - solver.WallTime()
+        if remaining < 1.0:
+            return solver
+
+        # Hints are left as they are: hinting the first pass's roster pins
+        # the search near it and the deviation sum barely moves
+        self.model.Add(self.spread <= round(solver.ObjectiveValue()))
+        self.model.Minimize(self.deviation_sum)
+
+        second = self._new_solver(remaining)
+        # A tie-breaker only needs to be close: stop within 1% of the bound
+        second.parameters.relative_gap_limit = 0.01
+        status = second.Solve(self.model)
+        return second if status in (cp_model.OPTIMAL, cp_model.FEASIBLE) else solver
 
     # ------------------------------------------------------------------
     # Solve & extract results
@@ -226,44 +398,46 @@ class RosterSolver:
         if self.errors:
             return None, None, self.errors
 
-        self._add_one_shift_per_day()
+        self._add_total_workload_constraint()
         self._add_rest_constraints()
         self._add_ph_bidding_constraints()
         self._add_role_max_shift_constraints()
+        self._add_symmetry_breaking_constraints()
         self._set_fairness_objective()
+        self._add_greedy_hint()
 
-        solver = cp_model.CpSolver()
-        solver.parameters.max_time_in_seconds = 10.0
+        solver = self._new_solver(self.TIME_LIMIT)
         status = solver.Solve(self.model)
+        if status == cp_model.OPTIMAL and self.balance_deviation:
+            solver = self._tie_break_on_deviation(solver)
 
         if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
-            roster_results = []
+            roster_cols   = {c: [] for c in _ROSTER_COLUMNS}
+            points_by_emp = defaultdict(int)
             for (emp_name, d, s), var in self.variables.items():
-                if solver.Value(var) == 1:
-                    roster_results.append({
-                        "Date":     d,
-                        "Day":      d.strftime('%A'),
-                        "Employee": emp_name,
-                        "Team":     self.emp_team[emp_name],
-                        "Category": s.category,
-                        "Shift":    s.value,
-                    })
-
-            summary_results = []
-            for emp in self.employees:
-                new_points = 0
-                for (name, d, s), var in self.variables.items():
-                    if name == emp.name and solver.Value(var) == 1:
-                        new_points += self.point_weights.get(s, 10)
-
-                summary_results.append({
-                    "Employee":        emp.name,
-                    "Team":            emp.team,
-                    "Starting Points": emp.ytd_points,
-                    "Points Earned":   new_points / 10,
-                    "Total Points":    emp.ytd_points + (new_points / 10),
-                })
-
-            return pd.DataFrame(roster_results), pd.DataFrame(summary_results), []
+                if solver.BooleanValue(var):
+                    roster_cols["Date"].append(d)
+                    roster_cols["Day"].append(_day_name(d))
+                    roster_cols["Employee"].append(emp_name)
+                    roster_cols["Team"].append(self.emp_team[emp_name])
+                    roster_cols["Category"].append(s.category)
+                    roster_cols["Shift"].append(s.value)
+                    points_by_emp[emp_name] += self.point_weights.get(s, 10)
+
+            earned = [points_by_emp[emp.name] / 10 for emp in self.employees]
+            summary_cols = {
+                "Employee":        [emp.name for emp in self.employees],
+                "Team":            [emp.team for emp in self.employees],
+                "Starting Points": [emp.ytd_points for emp in self.employees],
+                "Points Earned":   earned,
+                "Total Points":    [emp.ytd_points + e for emp, e in zip(self.employees, earned)],
+            }
+
+            # Compact dtypes: datetime64 dates sort natively, repeated labels become int codes
+            roster_df = pd.DataFrame(roster_cols) \
+                          .astype({"Date": "datetime64[ns]", "Employee": "category", "Team": "category",
+                                   "Category": "category", "Shift": "category"})
+            summary_df = pd.DataFrame(summary_cols).astype({"Employee": "category", "Team": "category"})
+            return roster_df, summary_df, []
 
         return None, None, ["⚠️ Logic Conflict: Constraints are too tight to find a fair balance."]